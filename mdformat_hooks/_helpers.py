@@ -3,17 +3,22 @@
 from __future__ import annotations
 
 from collections.abc import Mapping
+from types import MappingProxyType
 from typing import Any
 
 from . import __plugin_name__
 
 ContextOptions = Mapping[str, Any]
 
+# Shared read-only fallback to avoid allocating an empty dict per missing key
+_EMPTY: ContextOptions = MappingProxyType({})
+
 
 def get_conf(options: ContextOptions, key: str) -> bool | str | int | None:
     """Read setting from mdformat configuration Context."""
-    if (api := options["mdformat"].get(key)) is not None:
+    mdformat_options = options["mdformat"]
+    if (api := mdformat_options.get(key)) is not None:
         return api  # From API
     return (
-        options["mdformat"].get("plugin", {}).get(__plugin_name__, {}).get(key)
+        mdformat_options.get("plugin", _EMPTY).get(__plugin_name__, _EMPTY).get(key)
     )  # from cli_or_toml
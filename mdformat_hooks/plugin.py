@@ -3,9 +3,13 @@
 from __future__ import annotations
 
 import argparse
-import subprocess  # noqa: S404
+import logging
+import re
+import shutil
 import sys
+import weakref
 from collections.abc import Mapping
+from functools import lru_cache
 from typing import Any
 
 from mdformat.renderer import RenderContext, RenderTreeNode
@@ -13,6 +17,37 @@ from mdformat.renderer.typing import Postprocess
 
 from ._helpers import get_conf
 
+LOGGER = logging.getLogger(__name__)
+
+
+# CLI flags and their `add_argument` keyword arguments. Defaults stay None because
+# mdformat lets any other CLI default override the TOML configuration
+_ARG_SPECS: tuple[tuple[str, Mapping[str, Any]], ...] = (
+    (
+        "--post-command",
+        {
+            "type": str,
+            "help": "Shell command to run after formatting (receives text via stdin)",
+        },
+    ),
+    (
+        "--timeout",
+        {
+            "type": int,
+            "default": None,
+            "help": "Timeout in seconds for shell commands (default: 30)",
+        },
+    ),
+    (
+        "--strict-hooks",
+        {
+            "action": "store_true",
+            "default": None,
+            "help": "Fail formatting if shell command returns non-zero exit code",
+        },
+    ),
+)
+
 
 def add_cli_argument_group(group: argparse._ArgumentGroup) -> None:
     """Add CLI options for shell hooks.
@@ -20,34 +55,114 @@ def add_cli_argument_group(group: argparse._ArgumentGroup) -> None:
     Options are stored in `mdit.options["mdformat"]["plugin"]["hooks"]`
 
     """
-    group.add_argument(
-        "--post-command",
-        type=str,
-        help="Shell command to run after formatting (receives text via stdin)",
-    )
-    group.add_argument(
-        "--timeout",
-        type=int,
-        default=30,
-        help="Timeout in seconds for shell commands (default: 30)",
-    )
-    group.add_argument(
-        "--strict-hooks",
-        action="store_true",
-        help="Fail formatting if shell command returns non-zero exit code",
+    for flag, kwargs in _ARG_SPECS:
+        group.add_argument(flag, **kwargs)
+
+
+# mdformat renders twice when wrapping is enabled. If the hook left the document
+# unchanged, the second pass sends identical text, so successful outputs are
+# shared between the passes of one `mdformat.text` call and then discarded
+_ResultCache = dict[tuple[str, str], str]
+_last_render: tuple[weakref.ref[Any], _ResultCache] | None = None
+
+
+def _get_render_cache(options: object) -> _ResultCache | None:
+    """Return the result cache for the rendering passes of one document.
+
+    mdformat reuses one options object for both passes and creates a new one
+    for every `mdformat.text` call, so results never outlive a single call.
+
+    """
+    global _last_render  # noqa: PLW0603
+    if _last_render is None or _last_render[0]() is not options:
+        try:
+            _last_render = (weakref.ref(options), {})
+        except TypeError:  # Options that can't be weakly referenced aren't cached
+            return None
+    return _last_render[1]
+
+
+# Characters that need a shell to interpret (pipes, redirects, expansions, etc.)
+_SHELL_META_RE = re.compile(r"[|&;<>()$`\\*?\[\]{}~!#\n]")
+
+
+@lru_cache(maxsize=64)
+def _resolve_argv(command: str) -> tuple[str, ...] | None:
+    """Split a command into argv when it can be executed without a shell.
+
+    Running the program directly avoids spawning `/bin/sh` on every call. The
+    result is cached because resolving the program scans every `PATH` entry.
+
+    Returns:
+        tuple[str, ...] | None: argv, or None when the command needs a shell (shell
+            syntax, environment assignments, builtins, unparsable quoting, or
+            running on Windows)
+
+    """
+    if sys.platform == "win32" or _SHELL_META_RE.search(command):
+        return None
+    import shlex  # noqa: PLC0415
+
+    try:
+        argv = tuple(shlex.split(command))
+    except ValueError:  # e.g. unbalanced quotes; let the shell report the error
+        return None
+    if not argv or "=" in argv[0] or shutil.which(argv[0]) is None:
+        return None
+    return argv
+
+
+def _decode_output(output: bytes) -> str:
+    """Decode command output once, normalizing newlines as text-mode pipes do."""
+    decoded = output.decode("utf-8")
+    if "\r" in decoded:
+        return decoded.replace("\r\n", "\n").replace("\r", "\n")
+    return decoded
+
+
+def _report_failure(
+    returncode: int, stderr_bytes: bytes, command: str, *, strict: bool
+) -> None:
+    """Log a non-zero exit and raise in strict mode.
+
+    Raises:
+        RuntimeError: If strict=True
+
+    """
+    stderr = stderr_bytes.decode("utf-8", errors="replace")
+    LOGGER.warning(
+        "mdformat-hooks: Command failed with code %s: %s%s",
+        returncode,
+        command,
+        f"\nError output: {stderr}" if stderr else "",
     )
+    if strict:
+        stderr_info = f"stderr: {stderr}"
+        full_error = (
+            f"Command failed with exit code {returncode}: {command}\n{stderr_info}"
+        )
+        raise RuntimeError(full_error)
 
 
 def _run_shell_command(
-    text: str, command: str | None, timeout: int, *, strict: bool = False
+    text: str,
+    command: str | None,
+    timeout: int,
+    *,
+    strict: bool = False,
+    cache: _ResultCache | None = None,
 ) -> str:
     """Run a shell command with the text as stdin.
 
+    When a cache is provided, successful results are stored in it, so identical
+    input for the same command is only sent to the subprocess once.
+
     Args:
         text: Input text to pass to the command via stdin
         command: Shell command to execute
         timeout: Command timeout in seconds
         strict: If True, raise exception on non-zero exit codes
+        cache: Optional mapping of earlier successful results to reuse
 
     Returns:
         Command stdout on success, or original text on failure (non-strict mode)
@@ -56,48 +171,46 @@ def _run_shell_command(
         RuntimeError: If strict=True and command fails, times out, or errors
 
     """
-    if not command:
-        return text
+    if not command or not text or text.isspace():
+        return text  # Nothing to process, so skip spawning a subprocess
+    # Deferred because mdformat imports every plugin on startup, even when no
+    # hook is configured
+    import subprocess  # noqa: PLC0415, S404
+
+    if cache is not None and (cached := cache.get((command, text))) is not None:
+        return cached
 
+    argv = _resolve_argv(command)
     try:
-        result = subprocess.run(  # noqa: S602
-            command,
-            input=text,
+        result = subprocess.run(  # noqa: S603
+            command if argv is None else argv,
+            input=text.encode("utf-8"),
             capture_output=True,
-            text=True,
-            shell=True,
+            shell=argv is None,
             timeout=timeout,
             check=False,
         )
-
-        if result.returncode == 0:
-            return result.stdout
-        # On error, log and either raise (strict mode) or return original text
-        error_msg = (
-            f"mdformat-hooks: Command failed with code {result.returncode}: {command}"
-        )
-        print(error_msg, file=sys.stderr)  # noqa: T201
-        if result.stderr:
-            print(f"Error output: {result.stderr}", file=sys.stderr)  # noqa: T201
-        if strict:
-            stderr_info = f"stderr: {result.stderr}"
-            full_error = (
-                f"Command failed with exit code {result.returncode}: {command}\n"
-                f"{stderr_info}"
-            )
-            raise RuntimeError(full_error)  # noqa: TRY301
     except subprocess.TimeoutExpired as e:
-        timeout_msg = (
-            f"mdformat-hooks: Command timed out after {timeout} seconds: {command}"
+        LOGGER.warning(
+            "mdformat-hooks: Command timed out after %s seconds: %s", timeout, command
         )
-        print(timeout_msg, file=sys.stderr)  # noqa: T201
         if strict:
+            timeout_msg = (
+                f"mdformat-hooks: Command timed out after {timeout} seconds: {command}"
+            )
             raise RuntimeError(timeout_msg) from e
     except Exception as e:
-        error_msg = f"mdformat-hooks: Error running command: {e}"
-        print(error_msg, file=sys.stderr)  # noqa: T201
+        LOGGER.warning("mdformat-hooks: Error running command: %s", e)
         if strict:
             raise
+    else:
+        if result.returncode == 0:
+            output = _decode_output(result.stdout)
+            if cache is not None:
+                cache[command, text] = output
+            return output
+        # On error, log and either raise (strict mode) or return original text
+        _report_failure(result.returncode, result.stderr, command, strict=strict)
     return text
 
 
@@ -112,10 +225,20 @@ def _create_post_processor(options: Mapping[str, Any]) -> Postprocess | None:
 
     timeout = get_conf(options, "timeout") or 30
     strict = get_conf(options, "strict_hooks") or False
+    return _get_processor(str(post_command), int(timeout), bool(strict))
+
+
+@lru_cache(maxsize=8)
+def _get_processor(post_command: str, timeout: int, strict: bool) -> Postprocess:
+    """Build the processor once per distinct configuration."""
 
-    def processor(text: str, _node: RenderTreeNode, _context: RenderContext) -> str:
+    def processor(text: str, _node: RenderTreeNode, context: RenderContext) -> str:
         return _run_shell_command(
-            text, str(post_command), int(timeout), strict=bool(strict)
+            text,
+            post_command,
+            timeout,
+            strict=strict,
+            cache=_get_render_cache(context.options),
         )
 
     return processor
@@ -138,11 +261,11 @@ def _dynamic_postprocessor(
 ) -> str:
     """Dynamic postprocessor that checks for commands at runtime.
 
-    Only processes the document root node to avoid running hooks
-    multiple times for nested nodes in the rendering tree.
+    Registered for mdformat's `root` node, so hooks run once per rendered
+    document rather than for nested nodes in the rendering tree.
     """
     # Only process the document root node
-    if node.type != "document":
+    if node.type != "root":
         return text
 
     options = context.options
@@ -151,9 +274,10 @@ def _dynamic_postprocessor(
     # Check for configuration in the expected location
     processor = _create_post_processor(options)
     if processor:
-        return processor(text, node, context)
+        # mdformat appends the final newline after postprocessing the root
+        return processor(text, node, context).rstrip("\n")
     return text
 
 
 # Static postprocessor mapping expected by mdformat
-POSTPROCESSORS: Mapping[str, Postprocess] = {"document": _dynamic_postprocessor}
+POSTPROCESSORS: Mapping[str, Postprocess] = {"root": _dynamic_postprocessor}
@@ -17,18 +17,21 @@ def flatten(nested_list: list[list[T]]) -> list[T]:
     return [*chain(*nested_list)]
 
 
-fixtures = flatten(
-    [
-        read_fixture_file(Path(__file__).parent / "fixtures" / fixture_path)
-        for fixture_path in ("hooks.md",)
-    ],
+fixtures = tuple(
+    flatten(
+        [
+            read_fixture_file(Path(__file__).parent / "fixtures" / fixture_path)
+            for fixture_path in ("hooks.md",)
+        ],
+    )
 )
+fixture_ids = tuple(title for _line, title, _text, _expected in fixtures)
 
 
 @pytest.mark.parametrize(
     ("line", "title", "text", "expected"),
     fixtures,
-    ids=[f[1] for f in fixtures],
+    ids=fixture_ids,
 )
 def test_format_fixtures(line, title, text, expected):
     output = mdformat.text(text, extensions={"hooks"})
@@ -1,6 +1,7 @@
 from pathlib import Path
 
 import mdformat
+import pytest
 
 
 def test_mdformat_text():
@@ -10,5 +11,6 @@ def test_mdformat_text():
 
     result = mdformat.text(content, extensions={"hooks"})
 
-    pth.write_text(result)  # Easier to debug with git
-    assert result == content, "Differences found in format. Review in git."
+    if result != content:
+        pth.write_text(result)  # Easier to debug with git
+        pytest.fail("Differences found in format. Review in git.")
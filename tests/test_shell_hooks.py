@@ -3,80 +3,235 @@
 from __future__ import annotations
 
 import argparse
+import subprocess  # noqa: S404
+import sys
+from types import SimpleNamespace
+from typing import Any
 from unittest.mock import Mock, patch
 
 import mdformat
 import pytest
+from mdformat._cli import run as run_cli
 
 from mdformat_hooks.plugin import (
     POSTPROCESSORS,
     _create_post_processor,
+    _decode_output,
     _dynamic_postprocessor,
+    _get_render_cache,
+    _resolve_argv,
     _run_shell_command,
     add_cli_argument_group,
 )
 
+_TEXT = "Hello, World!"
+_MARKDOWN = "# Hello\n\nWorld!\n"
+_DOCUMENT: Any = SimpleNamespace(type="root")
 
-def test_run_shell_command_success():
-    """Test successful shell command execution."""
-    text = "Hello, World!"
-    # Use a simple echo command that should work on all platforms
-    result = _run_shell_command(text, "cat", timeout=5)
-    assert result == text
+
+def _make_context(**hooks):
+    """Build a lightweight render context with the given hook options."""
+    return SimpleNamespace(options={"mdformat": {"plugin": {"hooks": hooks}}})
+
+
+@pytest.mark.parametrize(
+    ("command", "strict", "error"),
+    [
+        ("cat", False, None),
+        ("cat", True, None),
+        ("false", False, None),  # Non-strict (default) returns original text
+        ("false", True, "Command failed with exit code"),
+    ],
+)
+def test_run_shell_command_exit_status(command, strict, error):
+    """Test command success and failure with and without strict mode."""
+    if error:
+        with pytest.raises(RuntimeError, match=error):
+            _run_shell_command(_TEXT, command, timeout=5, strict=strict)
+    else:
+        result = _run_shell_command(_TEXT, command, timeout=5, strict=strict)
+        assert result == _TEXT
 
 
 def test_run_shell_command_with_none():
     """Test that None command returns original text."""
-    text = "Hello, World!"
-    result = _run_shell_command(text, None, timeout=5)
-    assert result == text
+    result = _run_shell_command(_TEXT, None, timeout=5)
+    assert result == _TEXT
 
 
-def test_run_shell_command_error():
-    """Test that command error returns original text."""
-    text = "Hello, World!"
-    # Use a command that will fail
-    result = _run_shell_command(text, "false", timeout=5)
-    assert result == text
+def test_run_shell_command_error_logged(caplog):
+    """Test that a failing command logs a single warning with its stderr."""
+    result = _run_shell_command(_TEXT, "echo oops >&2; false", timeout=5)
+    assert result == _TEXT
+    assert len(caplog.records) == 1
+    assert caplog.records[0].levelname == "WARNING"
+    assert "Command failed with code 1" in caplog.text
+    assert "Error output: oops" in caplog.text
+
 
+def test_run_shell_command_error_logged_once_in_strict_mode(caplog):
+    """Test that a failing command in strict mode logs one warning and raises."""
+    with pytest.raises(RuntimeError, match="Command failed with exit code 1"):
+        _run_shell_command(_TEXT, "false", timeout=5, strict=True)
+    assert len(caplog.records) == 1
+    assert "Command failed with code 1" in caplog.text
 
-def test_run_shell_command_timeout():
+
+@patch("subprocess.run")
+def test_run_shell_command_timeout(mock_run):
     """Test that command timeout returns original text."""
-    text = "Hello, World!"
-    # Use a command that will timeout
-    result = _run_shell_command(text, "sleep 10", timeout=0.1)
+    mock_run.side_effect = subprocess.TimeoutExpired(cmd="sleep 10", timeout=0.1)
+    result = _run_shell_command(_TEXT, "sleep 10", timeout=0.1)
+    assert result == _TEXT
+
+
+def test_run_shell_command_unicode():
+    """Test that non-ASCII text round-trips through the command as UTF-8."""
+    text = "Héllo, Wörld! 🎉\n"
+    result = _run_shell_command(text, "cat", timeout=5)
     assert result == text
 
 
+@pytest.mark.parametrize(
+    ("output", "expected"),
+    [
+        (b"a\nb\n", "a\nb\n"),
+        (b"a\r\nb\r\n", "a\nb\n"),
+        (b"a\rb", "a\nb"),
+        ("é".encode(), "é"),
+    ],
+)
+def test_decode_output(output, expected):
+    """Test that output is decoded as UTF-8 with normalized newlines."""
+    assert _decode_output(output) == expected
+
+
+def test_run_shell_command_with_shell_syntax():
+    """Test that commands using shell features still run through the shell."""
+    result = _run_shell_command(_TEXT, "cat | cat", timeout=5)
+    assert result == _TEXT
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Always uses the shell")
+def test_resolve_argv_plain_command():
+    """Test that a plain command is split into argv and bypasses the shell."""
+    assert _resolve_argv("cat -u") == ("cat", "-u")
+    assert _resolve_argv("cat 'a b'") == ("cat", "a b")
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "cat | cat",
+        "cat > out.md",
+        "cat && true",
+        "echo $HOME",
+        "cat *.md",
+        "FOO=1 cat",
+        "not-a-real-command-for-mdformat-hooks",
+        "cat 'foo",
+        "",
+    ],
+)
+def test_resolve_argv_needs_shell(command):
+    """Test that shell syntax and unknown programs fall back to the shell."""
+    assert _resolve_argv(command) is None
+
+
+def test_run_shell_command_unbalanced_quotes():
+    """Test that a command the shell can't parse is non-fatal by default."""
+    assert _run_shell_command(_TEXT, "cat 'foo", timeout=5) == _TEXT
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Always uses the shell")
+def test_resolve_argv_cached():
+    """Test that the PATH lookup is only performed once per command."""
+    _resolve_argv.cache_clear()
+    with patch("shutil.which", return_value="/bin/cat") as mock_which:
+        _resolve_argv("cat")
+        _resolve_argv("cat")
+    mock_which.assert_called_once_with("cat")
+    _resolve_argv.cache_clear()
+
+
+@patch("subprocess.run")
+@pytest.mark.parametrize("text", ["", "  \n\n"])
+def test_run_shell_command_skips_blank_text(mock_run, text):
+    """Test that blank text is returned without spawning a subprocess."""
+    assert _run_shell_command(text, "post-cmd", timeout=5) == text
+    mock_run.assert_not_called()
+
+
+@patch("subprocess.run")
+def test_run_shell_command_caches_success(mock_run):
+    """Test that identical input for the same command only runs once."""
+    mock_run.return_value = Mock(returncode=0, stdout=b"processed text", stderr=b"")
+    cache: dict[tuple[str, str], str] = {}
+
+    for _ in range(2):
+        result = _run_shell_command("input text", "post-cmd", timeout=5, cache=cache)
+        assert result == "processed text"
+    mock_run.assert_called_once()
+
+    _run_shell_command("other text", "post-cmd", timeout=5, cache=cache)
+    _run_shell_command("input text", "other-cmd", timeout=5, cache=cache)
+    _run_shell_command("input text", "post-cmd", timeout=5)  # No cache
+    expected_calls = 4
+    assert mock_run.call_count == expected_calls
+
+
+@patch("subprocess.run")
+def test_run_shell_command_does_not_cache_failure(mock_run):
+    """Test that failed commands are retried rather than cached."""
+    mock_run.return_value = Mock(returncode=1, stdout=b"", stderr=b"")
+    cache: dict[tuple[str, str], str] = {}
+
+    _run_shell_command("input text", "post-cmd", timeout=5, cache=cache)
+    _run_shell_command("input text", "post-cmd", timeout=5, cache=cache)
+    assert not cache
+    expected_calls = 2
+    assert mock_run.call_count == expected_calls
+
+
+def test_get_render_cache_scoped_to_options():
+    """Test that results are only shared while the same options object is used."""
+
+    class Options:
+        """Stand-in for mdformat's weakly referenceable options object."""
+
+    options, other_options = Options(), Options()
+    cache = _get_render_cache(options)
+    assert cache is not None
+    assert _get_render_cache(options) is cache
+    assert _get_render_cache(other_options) is not cache
+    assert _get_render_cache(options) is not cache
+    assert _get_render_cache({}) is None  # Plain dicts can't be weakly referenced
+
+
 def test_postprocessors_dict():
-    """Test POSTPROCESSORS is a proper dict with document processor."""
+    """Test POSTPROCESSORS is a proper dict with a root (document) processor."""
     assert isinstance(POSTPROCESSORS, dict)
-    assert "document" in POSTPROCESSORS
-    assert callable(POSTPROCESSORS["document"])
+    assert "root" in POSTPROCESSORS
+    assert callable(POSTPROCESSORS["root"])
+
+
+def test_dynamic_postprocessor_ignores_nested_nodes():
+    """Test that only the root node is passed to the hook."""
+    context = _make_context(post_command="false", strict_hooks=True)
+    node: Any = SimpleNamespace(type="paragraph")
+    assert _dynamic_postprocessor("test text", node, context) == "test text"
 
 
 def test_dynamic_postprocessor_with_no_config():
     """Test dynamic postprocessor returns text unchanged with no config."""
-    mock_context = Mock(options={"mdformat": {"plugin": {"hooks": {}}}})
-    result = _dynamic_postprocessor("test text", Mock(), mock_context)
+    result = _dynamic_postprocessor("test text", _DOCUMENT, _make_context())
     assert result == "test text"
 
 
 def test_dynamic_postprocessor_with_commands():
     """Test dynamic postprocessor applies commands."""
-    mock_context = Mock(
-        options={
-            "mdformat": {
-                "plugin": {
-                    "hooks": {
-                        "post_command": "cat",
-                        "timeout": 10,
-                    }
-                }
-            }
-        }
-    )
-    result = _dynamic_postprocessor("test text", Mock(), mock_context)
+    context = _make_context(post_command="cat", timeout=10)
+    result = _dynamic_postprocessor("test text", _DOCUMENT, context)
     # The cat command should return the same text
     assert result == "test text"
 
@@ -86,45 +241,28 @@ def test_post_processor_runs_command(mock_run):
     """Test that post processor runs post command."""
     mock_run.return_value = Mock(
         returncode=0,
-        stdout="processed text",
-        stderr="",
+        stdout=b"processed text",
+        stderr=b"",
     )
 
-    options = {
-        "mdformat": {
-            "plugin": {
-                "hooks": {
-                    "post_command": "post-cmd",
-                    "timeout": 10,
-                }
-            }
-        }
-    }
-
+    options = _make_context(post_command="post-cmd", timeout=10).options
     processor = _create_post_processor(options)
     assert processor is not None
 
-    mock_node = Mock()
-    mock_context = Mock()
-    result = processor("input text", mock_node, mock_context)  # noqa: F841
+    processor("input text", _DOCUMENT, _make_context())
 
-    # Should have been called once
-    assert mock_run.call_count == 1
+    mock_run.assert_called_once()
 
 
 def test_mdformat_with_hooks():
     """Test mdformat integration with hooks."""
-    text = "# Hello\n\nWorld!\n"
-
     # Test without any hooks (should just format normally)
-    result = mdformat.text(text, extensions={"hooks"})
-    assert result == "# Hello\n\nWorld!\n"
+    result = mdformat.text(_MARKDOWN, extensions={"hooks"})
+    assert result == _MARKDOWN
 
 
 def test_mdformat_with_post_command():
     """Test mdformat with a simple post-command."""
-    text = "# Hello\n\nWorld!\n"
-
     # Use cat command (should return the same text)
     options = {
         "plugin": {
@@ -133,83 +271,131 @@ def test_mdformat_with_post_command():
             }
         }
     }
-    result = mdformat.text(text, extensions={"hooks"}, options=options)
-    assert result == "# Hello\n\nWorld!\n"
+    result = mdformat.text(_MARKDOWN, extensions={"hooks"}, options=options)
+    assert result == _MARKDOWN
 
 
-# Strict mode tests
-def test_strict_mode_success():
-    """Strict mode passes when command succeeds."""
-    text = "Hello, World!"
-    result = _run_shell_command(text, "cat", timeout=5, strict=True)
-    assert result == text
+@patch("subprocess.run")
+def test_mdformat_applies_post_command_output(mock_run):
+    """Test that mdformat returns the post-command output for the document."""
+    mock_run.return_value = Mock(returncode=0, stdout=b"# Processed\n", stderr=b"")
+    options = {"plugin": {"hooks": {"post_command": "post-cmd"}}}
 
+    result = mdformat.text(_MARKDOWN, extensions={"hooks"}, options=options)
 
-def test_strict_mode_failure_nonzero_exit():
-    """Strict mode raises exception on non-zero exit."""
-    text = "Hello, World!"
-    with pytest.raises(RuntimeError, match="Command failed with exit code"):
-        _run_shell_command(text, "false", timeout=5, strict=True)
+    assert result == "# Processed\n"
+    mock_run.assert_called_once()
+    # The root node is rendered without the final newline
+    assert mock_run.call_args.kwargs["input"] == _MARKDOWN.rstrip("\n").encode()
 
 
-def test_strict_mode_timeout():
-    """Strict mode raises exception on timeout."""
-    text = "Hello, World!"
-    with pytest.raises(RuntimeError, match="Command timed out"):
-        _run_shell_command(text, "sleep 10", timeout=0.1, strict=True)
+@patch("subprocess.run")
+def test_mdformat_wrap_reuses_cached_output(mock_run):
+    """Test that the second rendering pass for wrapping hits the result cache."""
+    mock_run.return_value = Mock(returncode=0, stdout=_MARKDOWN.encode(), stderr=b"")
+    options = {"wrap": 80, "plugin": {"hooks": {"post_command": "post-cmd"}}}
 
+    result = mdformat.text(_MARKDOWN, extensions={"hooks"}, options=options)
 
-def test_strict_mode_disabled_by_default():
-    """Non-strict mode (default) returns original text on error."""
-    text = "Hello, World!"
-    # Command fails but strict is False (default), so should return original text
-    result = _run_shell_command(text, "false", timeout=5, strict=False)
-    assert result == text
+    assert result == _MARKDOWN
+    mock_run.assert_called_once()
+
+    # The cache does not outlive the call, so a new call runs the command again
+    mdformat.text(_MARKDOWN, extensions={"hooks"}, options=options)
+    expected_calls = 2
+    assert mock_run.call_count == expected_calls
+
+
+def test_cli_applies_post_command(tmp_path):
+    """Test that the CLI writes post-command output that keeps the same HTML."""
+    path = tmp_path / "test.md"
+    path.write_text("# Title\n\n- item\n", encoding="utf-8")
+
+    exit_code = run_cli([str(path), "--post-command", "sed 's/^- /* /'"])
+
+    assert exit_code == 0
+    assert path.read_text(encoding="utf-8") == "# Title\n\n* item\n"
+
+
+@pytest.mark.parametrize(
+    ("extra_args", "expected_code", "expected_text"),
+    [
+        ([], 1, "# Title\n"),  # Changed content fails mdformat's HTML validation
+        (["--no-validate"], 0, "# TITLE\n"),
+    ],
+)
+def test_cli_content_change_validation(
+    tmp_path, extra_args, expected_code, expected_text
+):
+    """Test that content-changing commands need mdformat's validation disabled."""
+    path = tmp_path / "test.md"
+    path.write_text("# Title\n", encoding="utf-8")
+
+    exit_code = run_cli(
+        [
+            str(path),
+            "--post-command",
+            "tr a-z A-Z",
+            "--strict-hooks",
+            *extra_args,
+        ]
+    )
+
+    assert exit_code == expected_code
+    assert path.read_text(encoding="utf-8") == expected_text
+
+
+def test_cli_reads_strict_hooks_from_toml(tmp_path):
+    """Test that CLI flag defaults don't override the TOML hook options."""
+    (tmp_path / ".mdformat.toml").write_text(
+        '[plugin.hooks]\npost_command = "false"\nstrict_hooks = true\n',
+        encoding="utf-8",
+    )
+    path = tmp_path / "test.md"
+    path.write_text(_MARKDOWN, encoding="utf-8")
+
+    with pytest.raises(RuntimeError, match="Command failed with exit code 1"):
+        run_cli([str(path)], cache_toml=False)
+
+
+def test_create_post_processor_reuses_processor():
+    """Test that equal configuration returns the same cached processor."""
+
+    def make_options(timeout):
+        return _make_context(post_command="cat", timeout=timeout).options
+
+    processor = _create_post_processor(make_options(10))
+    assert processor is not None
+    assert _create_post_processor(make_options(10)) is processor
+    assert _create_post_processor(make_options(20)) is not processor
+
+
+# Strict mode tests
+@patch("subprocess.run")
+def test_strict_mode_timeout(mock_run):
+    """Strict mode raises exception on timeout."""
+    mock_run.side_effect = subprocess.TimeoutExpired(cmd="sleep 10", timeout=0.1)
+    with pytest.raises(RuntimeError, match="Command timed out"):
+        _run_shell_command(_TEXT, "sleep 10", timeout=0.1, strict=True)
 
 
 def test_strict_mode_with_post_command_failure():
     """Strict mode raises exception on post_command failure."""
-    mock_node = Mock()
-    mock_node.type = "document"
-
-    mock_context = Mock()
-    mock_context.options = {
-        "mdformat": {
-            "plugin": {
-                "hooks": {
-                    "post_command": "false",  # Command that fails
-                    "strict_hooks": True,
-                    "timeout": 10,
-                }
-            }
-        }
-    }
+    # Command that fails
+    context = _make_context(post_command="false", strict_hooks=True, timeout=10)
 
     # Should raise because post_command fails and strict=True
     with pytest.raises(RuntimeError, match="Command failed with exit code"):
-        _dynamic_postprocessor("test text", mock_node, mock_context)
+        _dynamic_postprocessor("test text", _DOCUMENT, context)
 
 
 def test_strict_mode_with_post_command_success():
     """Strict mode allows successful post_command to pass."""
-    mock_node = Mock()
-    mock_node.type = "document"
-
-    mock_context = Mock()
-    mock_context.options = {
-        "mdformat": {
-            "plugin": {
-                "hooks": {
-                    "post_command": "cat",  # Command that succeeds
-                    "strict_hooks": True,
-                    "timeout": 10,
-                }
-            }
-        }
-    }
+    # Command that succeeds
+    context = _make_context(post_command="cat", strict_hooks=True, timeout=10)
 
     # Should work fine because command succeeds
-    result = _dynamic_postprocessor("test text", mock_node, mock_context)
+    result = _dynamic_postprocessor("test text", _DOCUMENT, context)
     assert result == "test text"
 
 
@@ -218,31 +404,20 @@ def test_strict_mode_post_processor(mock_run):
     """Test that strict mode is passed to post processor."""
     mock_run.return_value = Mock(
         returncode=1,  # Failure
-        stdout="",
-        stderr="error output",
+        stdout=b"",
+        stderr=b"error output",
     )
 
-    options = {
-        "mdformat": {
-            "plugin": {
-                "hooks": {
-                    "post_command": "some-cmd",
-                    "strict_hooks": True,
-                    "timeout": 10,
-                }
-            }
-        }
-    }
-
+    options = _make_context(
+        post_command="some-cmd", strict_hooks=True, timeout=10
+    ).options
     processor = _create_post_processor(options)
     assert processor is not None
 
-    mock_node = Mock()
-    mock_context = Mock()
-
     # Should raise because command fails and strict=True
     with pytest.raises(RuntimeError, match="Command failed with exit code"):
-        processor("input text", mock_node, mock_context)
+        processor("input text", _DOCUMENT, _make_context())
+    mock_run.assert_called_once()
 
 
 # CLI argument group tests
@@ -276,11 +451,10 @@ def test_add_cli_argument_group_defaults():
     # Parse with no arguments to check defaults
     args = parser.parse_args([])
 
-    # Verify defaults (timeout default is 30 as defined in add_cli_argument_group)
-    default_timeout = 30
+    # Unset flags stay None so they don't override TOML configuration
     assert args.post_command is None
-    assert args.timeout == default_timeout
-    assert args.strict_hooks is False
+    assert args.timeout is None
+    assert args.strict_hooks is None
 
 
 def test_add_cli_argument_group_argument_properties():
@@ -303,8 +477,7 @@ def test_add_cli_argument_group_argument_properties():
     assert "timeout" in actions
     timeout_action = actions["timeout"]
     assert timeout_action.type is int
-    default_timeout = 30
-    assert timeout_action.default == default_timeout
+    assert timeout_action.default is None
     assert "Timeout" in timeout_action.help
 
     # Check strict_hooks argument